@@ -0,0 +1,31 @@
+"""
+Authentication Helpers
+
+Parsing helpers shared by the interactive authentication scripts.
+"""
+
+import re
+
+# Authorization code parameter in a pasted redirect URL
+CODE_PARAM_RE = re.compile(r'code=([^&#\s]+)')
+
+# Whitespace and stray quotes around pasted input
+_PASTE_JUNK = " \t\r\n'\""
+
+
+def extract_auth_code(text: str) -> str:
+    """
+    Extract the OAuth authorization code from user input
+
+    Accepts either the bare code or the full redirect URL
+    (e.g. http://localhost:8080/?code=XXXXX&state=upstox_auth).
+
+    Args:
+        text: Raw user input
+
+    Returns:
+        The authorization code, or an empty string if none was given
+    """
+    text = text.strip(_PASTE_JUNK)
+    match = CODE_PARAM_RE.search(text)
+    return match.group(1) if match else text
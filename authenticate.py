@@ -5,13 +5,16 @@ Simple and clean OAuth flow for Upstox API
 """
 
 from upstox_auth import create_upstox_client
+from auth_utils import extract_auth_code
 import sys
 
+# Banner rules, built once
+DOUBLE_RULE = "=" * 60
+SINGLE_RULE = "-" * 60
+
 def print_header():
     """Print application header"""
-    print("\n" + "=" * 60)
-    print("🔐 Upstox Authentication")
-    print("=" * 60 + "\n")
+    print(f"\n{DOUBLE_RULE}\n🔐 Upstox Authentication\n{DOUBLE_RULE}\n")
 
 def print_step(number: int, message: str):
     """Print step message"""
@@ -43,13 +46,15 @@ def main():
             
             # Test connection
             connection = client.check_connection()
-            if connection['connected']:
-                print(f"\n👤 User: {connection['user_name']}")
-                print(f"🏦 Broker: {connection['broker']}")
-                print(f"📊 Exchanges: {', '.join(connection['exchanges'])}")
+            if connection.connected:
+                print(
+                    f"\n👤 User: {connection.user_name}\n"
+                    f"🏦 Broker: {connection.broker}\n"
+                    f"📊 Exchanges: {', '.join(connection.exchanges)}\n"
+                    f"\n{SINGLE_RULE}"
+                )
                 
                 # Ask if user wants to re-authenticate
-                print("\n" + "-" * 60)
                 choice = input("Do you want to re-authenticate? (y/n): ").strip().lower()
                 
                 if choice != 'y':
@@ -59,9 +64,7 @@ def main():
                 print_warning("Saved token is invalid or expired")
         
         # Start fresh authentication
-        print("\n" + "=" * 60)
-        print("Starting OAuth Authentication Flow")
-        print("=" * 60 + "\n")
+        print(f"\n{DOUBLE_RULE}\nStarting OAuth Authentication Flow\n{DOUBLE_RULE}\n")
         
         # Get authorization URL
         auth_url = client.get_auth_url()
@@ -76,16 +79,17 @@ def main():
         print("(The code is the value after 'code=' and before '&state')\n")
         
         # Get authorization code
-        print("-" * 60)
-        code = input("Enter authorization code: ").strip()
+        print(SINGLE_RULE)
+        raw_code = input("Enter authorization code: ")
+        
+        # Accepts the bare code or the full redirect URL
+        code = extract_auth_code(raw_code)
         
         if not code:
             print_error("No code provided. Exiting.")
             sys.exit(1)
         
-        # Clean up code if user pasted full URL
-        if 'code=' in code:
-            code = code.split('code=')[1].split('&')[0]
+        if code != raw_code.strip():
             print(f"🔧 Extracted code: {code[:10]}...{code[-10:]}")
         
         print("\n🔄 Exchanging code for access token...")
@@ -96,10 +100,12 @@ def main():
         print_success("Successfully authenticated!")
         
         # Display user info
-        print(f"\n👤 User: {token_info['user_info']['user_name']}")
-        print(f"📧 Email: {token_info['user_info']['email']}")
-        print(f"🏦 Broker: {token_info['user_info']['broker']}")
-        print(f"🕒 Token expires at: {token_info.get('expires_at', 'Unknown')}")
+        print(
+            f"\n👤 User: {token_info.user_name}\n"
+            f"📧 Email: {token_info.email}\n"
+            f"🏦 Broker: {token_info.broker}\n"
+            f"🕒 Token expires at: {token_info.expires_at or 'Unknown'}"
+        )
         
         # Save token
         if client.save_token_to_file():
@@ -107,30 +113,35 @@ def main():
         else:
             print_warning("Could not save token to file")
         
-        print("\n" + "=" * 60)
-        print("🎉 Authentication completed successfully!")
-        print("=" * 60)
-        print("\nYou can now use the Upstox MCP server:")
-        print("  uv run python upstox_server.py")
-        print()
+        print(
+            f"\n{DOUBLE_RULE}\n"
+            "🎉 Authentication completed successfully!\n"
+            f"{DOUBLE_RULE}\n"
+            "\nYou can now use the Upstox MCP server:\n"
+            "  uv run python upstox_server.py\n"
+        )
         
     except ValueError as e:
         print_error(f"Configuration error: {e}")
-        print("\n💡 Make sure your .env file contains:")
-        print("   UPSTOX_API_KEY=your_api_key")
-        print("   UPSTOX_API_SECRET=your_api_secret")
-        print("   UPSTOX_REDIRECT_URI=http://localhost:8080")
+        print(
+            "\n💡 Make sure your .env file contains:\n"
+            "   UPSTOX_API_KEY=your_api_key\n"
+            "   UPSTOX_API_SECRET=your_api_secret\n"
+            "   UPSTOX_REDIRECT_URI=http://localhost:8080"
+        )
         sys.exit(1)
         
     except Exception as e:
         print_error(f"Authentication failed: {e}")
         
         if "Invalid Auth code" in str(e) or "401" in str(e):
-            print("\n🔧 Troubleshooting tips:")
-            print("  1. Get a fresh authorization code (they expire quickly)")
-            print("  2. Verify redirect URI matches your Upstox app settings")
-            print("  3. Copy only the code parameter, no extra characters")
-            print("  4. Complete the process within 5 minutes")
+            print(
+                "\n🔧 Troubleshooting tips:\n"
+                "  1. Get a fresh authorization code (they expire quickly)\n"
+                "  2. Verify redirect URI matches your Upstox app settings\n"
+                "  3. Copy only the code parameter, no extra characters\n"
+                "  4. Complete the process within 5 minutes"
+            )
         
         sys.exit(1)
 
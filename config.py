@@ -4,17 +4,126 @@ Handles configuration and authentication setup
 """
 
 import upstox_client
+from upstox_client.rest import ApiException
 import json
-import os
+import threading
 from pathlib import Path
+from urllib3.util.retry import Retry
+from cache_utils import TTLCache
+from json_utils import load_json_cached, loads_json, orjson
+from metrics import metrics
 
 # API version
 api_version = '2.0'
 
+# Shared configuration, API client and API wrappers. The configuration is
+# created once; only its access token is refreshed when the token file
+# changes, so the client's connection pool survives re-authentication.
+_configuration = None
+_token_data = None
+_api_client = None
+_api_instances = {}
+
+# Guards creation of the shared objects above; tools may run concurrently
+# (thread pool, background prefetch), and each must be built exactly once
+_lock = threading.RLock()
+
+# (url, query) -> (ETag, response) for GET requests, so a refresh of
+# unchanged data can be answered with a 304 instead of a full body
+_etag_cache = TTLCache(ttl=3600, maxsize=256)
+
+# Lower bound on kept-alive connections, so concurrent tool calls and the
+# prefetcher don't queue for a connection on small machines
+MIN_POOL_MAXSIZE = 20
+
+# Default total timeout (seconds) for each HTTP request made through the
+# shared client. Without it urllib3 waits on the socket indefinitely, and a
+# hung request keeps its worker thread busy long after the caller gave up.
+REQUEST_TIMEOUT = 5
+
+# Retry policy for the client's connection pools: only failures to connect
+# are retried, so a slow read never multiplies the request timeout and a
+# request that may have reached the server is never sent twice
+API_RETRY = Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.2)
+
+
+class UpstoxApiClient(upstox_client.ApiClient):
+    """
+    ApiClient tuned for the MCP server
+
+    Applies REQUEST_TIMEOUT to requests that don't set their own timeout,
+    counts requests and failures in the server metrics, revalidates
+    repeated GETs with If-None-Match when the API returned an ETag, and
+    parses JSON responses with orjson when it is installed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # RESTClientObject ignores configuration.retries, so install the
+        # policy as the default for every pool the PoolManager creates
+        self.rest_client.pool_manager.connection_pool_kw['retries'] = API_RETRY
+
+    def call_api(self, *args, **kwargs):
+        metrics.incr('api_calls')
+        try:
+            return super().call_api(*args, **kwargs)
+        except Exception:
+            metrics.incr('api_errors')
+            raise
+
+    def request(self, method, url, query_params=None, headers=None,
+                post_params=None, body=None, _preload_content=True,
+                _request_timeout=None):
+        if _request_timeout is None:
+            _request_timeout = REQUEST_TIMEOUT
+        if method != "GET" or not _preload_content:
+            return super().request(
+                method, url, query_params, headers, post_params, body,
+                _preload_content, _request_timeout
+            )
+
+        key = (url, tuple(query_params or ()))
+        cached = _etag_cache.get(key)
+        if cached is not None:
+            headers = dict(headers or {}, **{'If-None-Match': cached[0]})
+        try:
+            response = super().request(
+                method, url, query_params, headers, post_params, body,
+                _preload_content, _request_timeout
+            )
+        except ApiException as e:
+            if e.status == 304 and cached is not None:
+                metrics.incr('api_not_modified')
+                return cached[1]
+            raise
+
+        etag = response.getheader('ETag')
+        if etag:
+            _etag_cache.set(key, (etag, response))
+        return response
+
+    def deserialize(self, response, response_type):
+        # Same as the generated implementation, minus the stdlib JSON parse.
+        # This relies on the SDK's private __deserialize, so only take this
+        # path when orjson is actually available to make it worthwhile.
+        if orjson is None or response_type == "file":
+            return super().deserialize(response, response_type)
+        try:
+            data = loads_json(response.data)
+        except ValueError:
+            data = response.data
+        return self._ApiClient__deserialize(data, response_type)
+
+
 def get_configuration():
     """
     Load and return Upstox configuration with access token
     
+    The same Configuration object is returned on every call. The token
+    file is stat()ed each time but only re-parsed when it changes on disk
+    (e.g. after re-running authenticate.py), so a long-running server can
+    call this before every request.
+    
     Returns:
         upstox_client.Configuration: Configured client
     
@@ -22,38 +131,83 @@ def get_configuration():
         FileNotFoundError: If token file doesn't exist
         ValueError: If token is invalid or missing
     """
-    token_file = Path('upstox_token.json')
-    
-    if not token_file.exists():
-        raise FileNotFoundError(
-            "Token file not found. Please run authentication first:\n"
-            "  uv run python authenticate.py"
-        )
-    
-    try:
-        with open(token_file, 'r') as f:
-            token_data = json.load(f)
+    global _configuration, _token_data
+    with _lock:
+        token_file = Path('upstox_token.json')
+        
+        try:
+            token_data = load_json_cached(token_file)
+            if _configuration is not None and token_data is _token_data:
+                return _configuration
         
-        access_token = token_data.get('access_token')
-        if not access_token:
-            raise ValueError("Access token missing in token file")
+            access_token = token_data.get('access_token')
+            if not access_token:
+                raise ValueError("Access token missing in token file")
         
-        # Create and configure client
-        configuration = upstox_client.Configuration()
-        configuration.access_token = access_token
+            # Create the client configuration on first load
+            if _configuration is None:
+                _configuration = upstox_client.Configuration()
+                # Keep enough warm connections for concurrent tool calls; the
+                # SDK default scales with the CPU count and may already be larger
+                _configuration.connection_pool_maxsize = max(
+                    MIN_POOL_MAXSIZE, _configuration.connection_pool_maxsize
+                )
+            _configuration.access_token = access_token
+            # Cached responses belong to the previous token
+            _etag_cache.clear()
         
-        return configuration
+            _token_data = token_data
+            return _configuration
         
-    except json.JSONDecodeError:
-        raise ValueError("Invalid token file format")
-    except Exception as e:
-        raise ValueError(f"Error loading configuration: {str(e)}")
-
-# Global configuration instance
-try:
-    configuration = get_configuration()
-except Exception as e:
-    # In case of errors, create empty config
-    # The server will handle authentication errors gracefully
-    configuration = upstox_client.Configuration()
-    print(f"⚠️  Warning: {str(e)}")
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                "Token file not found. Please run authentication first:\n"
+                "  uv run python authenticate.py"
+            ) from None
+        except json.JSONDecodeError:
+            raise ValueError("Invalid token file format")
+        except Exception as e:
+            raise ValueError(f"Error loading configuration: {str(e)}")
+
+
+def get_api_client():
+    """
+    Return the process-wide Upstox API client
+    
+    All API wrappers share this client, and with it one keep-alive
+    connection pool. Responses are requested gzip-compressed, and failed
+    connection attempts are retried according to API_RETRY.
+    
+    Returns:
+        UpstoxApiClient: Shared client
+    
+    Raises:
+        FileNotFoundError: If token file doesn't exist
+        ValueError: If token is invalid or missing
+    """
+    global _api_client
+    with _lock:
+        configuration = get_configuration()
+        if _api_client is None:
+            _api_client = UpstoxApiClient(configuration)
+            # JSON responses compress well; urllib3 decodes them transparently
+            _api_client.set_default_header('Accept-Encoding', 'gzip, deflate')
+        return _api_client
+
+
+def get_api(api_class):
+    """
+    Return a shared instance of an Upstox API wrapper
+    
+    Args:
+        api_class: Wrapper class, e.g. upstox_client.UserApi
+    
+    Returns:
+        Instance of api_class bound to the shared API client
+    """
+    with _lock:
+        api_client = get_api_client()
+        api = _api_instances.get(api_class)
+        if api is None:
+            api = _api_instances[api_class] = api_class(api_client)
+        return api
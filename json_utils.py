@@ -0,0 +1,123 @@
+"""
+JSON I/O Helpers
+
+Reads and writes JSON files with orjson when it is installed, falling back
+to the standard library otherwise.
+"""
+
+import os
+import tempfile
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+
+
+def load_json(path) -> Any:
+    """
+    Load and parse a JSON file
+
+    Args:
+        path: Path to the JSON file
+
+    Returns:
+        Parsed JSON data
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist
+        json.JSONDecodeError: If the file is not valid JSON
+    """
+    with open(path, 'rb') as f:
+        return loads_json(f.read())
+
+
+def loads_json(data) -> Any:
+    """
+    Parse JSON from str or bytes
+
+    Raises:
+        ValueError: If data is not valid JSON (both orjson's and the
+            standard library's decode errors subclass ValueError)
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Absolute path -> ((mtime_ns, size), data) for load_json_cached
+_file_cache = {}
+
+
+def load_json_cached(path) -> Any:
+    """
+    Load a JSON file, re-parsing it only when it changes on disk
+
+    The file is stat()ed on every call and parsed again only if its
+    modification time or size differs from the cached copy. The returned
+    object is shared between callers and must not be mutated.
+
+    Args:
+        path: Path to the JSON file
+
+    Returns:
+        Parsed JSON data
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist
+        json.JSONDecodeError: If the file is not valid JSON
+    """
+    key = os.path.abspath(path)
+    st = os.stat(key)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _file_cache.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    data = load_json(key)
+    _file_cache[key] = (stamp, data)
+    return data
+
+
+def encode_json(data: Any) -> bytes:
+    """Serialize data as compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+def dump_json(data: Any, path) -> None:
+    """
+    Serialize data as compact JSON and atomically write it to a file
+
+    Args:
+        data: JSON-serializable data
+        path: Destination file path
+    """
+    write_atomic(encode_json(data), path)
+
+
+def write_atomic(payload: bytes, path) -> None:
+    """
+    Atomically replace a file with payload
+
+    The bytes are written to a temporary file in the destination directory
+    and then renamed over the target, so a crash mid-write never leaves a
+    truncated file behind.
+
+    Args:
+        payload: Bytes to write
+        path: Destination file path
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False) as tmp:
+        try:
+            tmp.write(payload)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    os.replace(tmp.name, path)
@@ -0,0 +1,203 @@
+"""
+Server Metrics
+
+Counters and per-tool latency statistics for the MCP server, used to tune
+cache TTLs and the prefetcher. Each tool call can also be appended to a
+rotating JSONL log for offline analysis.
+"""
+
+import atexit
+import functools
+import inspect
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from json_utils import encode_json
+
+# Per-call JSONL log, off unless UPSTOX_METRICS_LOG names a file
+METRICS_LOG = os.getenv('UPSTOX_METRICS_LOG', '')
+
+# Size at which the metrics log is rotated, and how many old files to keep
+METRICS_LOG_MAX_BYTES = 10 * 1024 * 1024
+METRICS_LOG_BACKUPS = 3
+
+# Recent durations kept per tool for percentile estimates
+LATENCY_WINDOW = 1024
+
+
+class ToolStats:
+    """Call count, failures and wall time for one tool"""
+
+    __slots__ = ('calls', 'errors', 'total_ns', 'max_ns', 'recent_ns')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.recent_ns: Deque[int] = deque(maxlen=LATENCY_WINDOW)
+
+    def percentile_ms(self, pct: float) -> float:
+        """Return the pct-th percentile of recent durations in milliseconds"""
+        if not self.recent_ns:
+            return 0.0
+        ordered = sorted(self.recent_ns)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] / 1e6
+
+
+class Metrics:
+    """Thread-safe event counters and per-tool timing"""
+
+    def __init__(self, log_path: Optional[str] = None):
+        """
+        Args:
+            log_path: File that receives one JSON line per tool call, or
+                None to keep metrics in memory only
+        """
+        self.log_path = log_path or None
+        self.counters: Counter = Counter()
+        self.tools: Dict[str, ToolStats] = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._log = self._open_log(self.log_path) if self.log_path else None
+
+    @staticmethod
+    def _open_log(path: str) -> logging.Logger:
+        """
+        Return a logger that appends lines to path from a background thread
+
+        Callers only enqueue the record, so tool calls on the event loop
+        never wait on disk I/O; the file is rotated as it grows.
+        """
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=METRICS_LOG_MAX_BYTES, backupCount=METRICS_LOG_BACKUPS,
+            encoding='utf-8', delay=True
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(records, handler)
+        listener.start()
+        # Flush queued lines on shutdown
+        atexit.register(listener.stop)
+
+        log = logging.getLogger(f"{__name__}.calls")
+        log.setLevel(logging.INFO)
+        log.propagate = False
+        log.addHandler(logging.handlers.QueueHandler(records))
+        return log
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        """Add amount to the named counter"""
+        with self._lock:
+            self.counters[name] += amount
+
+    def record(self, tool: str, elapsed_ns: int, ok: bool) -> None:
+        """Record one tool call and append it to the metrics log"""
+        with self._lock:
+            stats = self.tools.get(tool)
+            if stats is None:
+                stats = self.tools[tool] = ToolStats()
+            stats.calls += 1
+            stats.errors += not ok
+            stats.total_ns += elapsed_ns
+            stats.max_ns = max(stats.max_ns, elapsed_ns)
+            stats.recent_ns.append(elapsed_ns)
+
+        if self._log is not None:
+            self._log.info(encode_json({
+                'ts': round(time.time(), 3),
+                'tool': tool,
+                'ms': round(elapsed_ns / 1e6, 3),
+                'ok': ok
+            }).decode())
+
+    def format_report(self) -> str:
+        """Return a human-readable snapshot of all counters and tool timings"""
+        with self._lock:
+            counters = dict(self.counters)
+            tools = {
+                name: (stats.calls, stats.errors, stats.total_ns, stats.max_ns,
+                       stats.percentile_ms(50), stats.percentile_ms(95))
+                for name, stats in self.tools.items()
+            }
+
+        parts = [f"📊 Server Metrics (uptime {time.time() - self.started:,.0f}s):\n\n"]
+        parts.append(
+            f"🗄️ Response cache: {_hit_rate(counters, 'cache')} hit rate (per tool call)\n"
+            f"💹 LTP cache: {_hit_rate(counters, 'ltp_cache')} hit rate (per instrument)\n"
+        )
+        for name in ('cache_hits', 'cache_misses', 'ltp_cache_hits', 'ltp_cache_misses',
+                     'prefetch_hits', 'prefetch_runs', 'prefetch_errors',
+                     'api_calls', 'api_errors', 'api_not_modified'):
+            parts.append(f"   {name}: {counters.get(name, 0)}\n")
+
+        if tools:
+            parts.append("\n⏱️ Tool Latency (ms):\n")
+            for name, (calls, errors, total_ns, max_ns, p50, p95) in sorted(tools.items()):
+                parts.append(
+                    f"   {name}: {calls} calls, {errors} errors, "
+                    f"avg {total_ns / calls / 1e6:.1f}, p50 {p50:.1f}, "
+                    f"p95 {p95:.1f}, max {max_ns / 1e6:.1f}\n"
+                )
+        return "".join(parts)
+
+
+def _hit_rate(counters: Dict[str, int], prefix: str) -> str:
+    """Format the hit rate of the <prefix>_hits/<prefix>_misses counters"""
+    hits = counters.get(f'{prefix}_hits', 0)
+    lookups = hits + counters.get(f'{prefix}_misses', 0)
+    return f"{hits / lookups * 100 if lookups else 0:.1f}%"
+
+
+def _is_error(result: Any) -> bool:
+    """Tools report failures as messages starting with ❌ rather than raising"""
+    return isinstance(result, str) and result.startswith("❌")
+
+
+def instrumented(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Decorator that records the wall time and outcome of each tool call
+
+    Works with both sync and async tools. A call counts as failed if it
+    raises or returns an error message.
+
+    Args:
+        name: Tool name to record the calls under
+    """
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                start = time.perf_counter_ns()
+                ok = False
+                try:
+                    result = await func(*args, **kwargs)
+                    ok = not _is_error(result)
+                    return result
+                finally:
+                    metrics.record(name, time.perf_counter_ns() - start, ok)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter_ns()
+            ok = False
+            try:
+                result = func(*args, **kwargs)
+                ok = not _is_error(result)
+                return result
+            finally:
+                metrics.record(name, time.perf_counter_ns() - start, ok)
+        return wrapper
+
+    return decorator
+
+
+# Process-wide metrics shared by the server and the API client
+metrics = Metrics(METRICS_LOG)
@@ -6,12 +6,21 @@ for connecting to Upstox services.
 """
 
 import os
-import json
-from typing import Optional, Dict, Any
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Dict, Tuple, TYPE_CHECKING
 from datetime import datetime, timedelta
-import upstox_client
-from upstox_client import ApiClient, Configuration
-from upstox_client.api import LoginApi, UserApi, MarketHolidaysAndTimingsApi
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, quote
+from json_utils import load_json_cached, dump_json
+
+# The upstox_client SDK is large and slow to import, so it is imported on
+# first use (see UpstoxAuth.config and the API wrapper properties). Scripts
+# that only build an authorization URL never pay for it.
+if TYPE_CHECKING:
+    from upstox_client import ApiClient, Configuration
+    from upstox_client.api import LoginApi, UserApi, MarketHolidaysAndTimingsApi
 
 # Try to load .env file if it exists
 try:
@@ -20,6 +29,54 @@ try:
 except ImportError:
     pass
 
+# How long a fetched user profile is reused before hitting the API again
+PROFILE_CACHE_TTL = 300  # seconds
+
+# Exchanges reported by get_market_status
+MARKET_EXCHANGES = ('NSE', 'BSE', 'NFO', 'BFO', 'MCX')
+
+
+@dataclass(slots=True, frozen=True)
+class UserProfile:
+    """Upstox user profile"""
+    user_name: str
+    email: str
+    user_id: str
+    broker: str
+    exchanges: Tuple[str, ...]
+    products: Tuple[str, ...]
+    user_type: str
+    poa: bool
+    is_active: bool
+
+
+@dataclass(slots=True, frozen=True)
+class TokenInfo:
+    """Access token and the user it was issued to"""
+    access_token: str
+    expires_at: str
+    user_name: str
+    email: str
+    user_id: str
+    broker: str
+
+
+@dataclass(slots=True, frozen=True)
+class ConnectionStatus:
+    """Result of a connection check; error is set when not connected"""
+    connected: bool
+    user_name: Optional[str] = None
+    broker: Optional[str] = None
+    exchanges: Tuple[str, ...] = ()
+    error: Optional[str] = None
+
+
+@dataclass(slots=True, frozen=True)
+class SessionSnapshot:
+    """User profile and per-exchange market status fetched together"""
+    profile: UserProfile
+    market: Dict[str, str]
+
 
 class UpstoxAuth:
     """Handles Upstox API authentication and basic operations"""
@@ -43,15 +100,94 @@ class UpstoxAuth:
                 "Provide them as parameters or set UPSTOX_API_KEY and UPSTOX_API_SECRET environment variables."
             )
         
-        # Initialize configuration
-        self.config = Configuration()
-        self.config.host = "https://api.upstox.com"
-        self.api_client = ApiClient(self.config)
+        # SDK configuration and client, built on first use
+        self._config = None
+        self._api_client = None
+        
+        # Guards first-use creation of the SDK objects; get_session_snapshot
+        # touches them from two threads at once, and each must be built once
+        # so both requests share one client and connection pool
+        self._lock = threading.RLock()
+        
+        # The API doesn't return the authorization URL, so build it here once;
+        # only the state parameter varies between calls
+        self._auth_url_prefix = (
+            "https://api.upstox.com/v2/login/authorization/dialog?"
+            + urlencode({
+                'response_type': 'code',
+                'client_id': self.api_key,
+                'redirect_uri': self.redirect_uri
+            })
+        )
+        
+        # API wrappers, likewise built on first use and reused across calls
+        self._login_api = None
+        self._user_api = None
+        self._market_api = None
+        
+        # Last fetched user profile and when it was fetched (time.monotonic)
+        self._profile_cache = None
+        self._profile_cache_ts = 0.0
         
         # Authentication state
         self.access_token = None
         self.token_expires_at = None
         self.is_authenticated = False
+    
+    @property
+    def config(self) -> "Configuration":
+        """SDK configuration carrying the current access token (created on first use)"""
+        if self._config is None:
+            with self._lock:
+                if self._config is None:
+                    from upstox_client import Configuration
+                    config = Configuration()
+                    config.host = "https://api.upstox.com"
+                    # Allow concurrent requests (see get_session_snapshot) to share the pool
+                    config.connection_pool_maxsize = max(config.connection_pool_maxsize, 4)
+                    config.access_token = self.access_token
+                    self._config = config
+        return self._config
+    
+    @property
+    def api_client(self) -> "ApiClient":
+        """ApiClient shared by all API wrappers (created on first use)"""
+        if self._api_client is None:
+            with self._lock:
+                if self._api_client is None:
+                    from upstox_client import ApiClient
+                    self._api_client = ApiClient(self.config)
+        return self._api_client
+    
+    @property
+    def login_api(self) -> "LoginApi":
+        """LoginApi bound to the shared ApiClient (created on first use)"""
+        if self._login_api is None:
+            with self._lock:
+                if self._login_api is None:
+                    from upstox_client.api import LoginApi
+                    self._login_api = LoginApi(self.api_client)
+        return self._login_api
+    
+    @property
+    def user_api(self) -> "UserApi":
+        """UserApi bound to the shared ApiClient (created on first use)"""
+        if self._user_api is None:
+            with self._lock:
+                if self._user_api is None:
+                    from upstox_client.api import UserApi
+                    self._user_api = UserApi(self.api_client)
+        return self._user_api
+    
+    @property
+    def market_api(self) -> "MarketHolidaysAndTimingsApi":
+        """MarketHolidaysAndTimingsApi bound to the shared ApiClient (created on first use)"""
+        if self._market_api is None:
+            with self._lock:
+                if self._market_api is None:
+                    from upstox_client.api import MarketHolidaysAndTimingsApi
+                    self._market_api = MarketHolidaysAndTimingsApi(self.api_client)
+        return self._market_api
         
     def get_auth_url(self, state: str = "upstox_auth") -> str:
         """
@@ -63,21 +199,9 @@ class UpstoxAuth:
         Returns:
             Authorization URL string
         """
-        try:
-            # Construct the authorization URL manually since the API doesn't return it
-            base_url = "https://api.upstox.com/v2/login/authorization/dialog"
-            auth_url = (
-                f"{base_url}?"
-                f"response_type=code&"
-                f"client_id={self.api_key}&"
-                f"redirect_uri={self.redirect_uri}&"
-                f"state={state}"
-            )
-            return auth_url
-        except Exception as e:
-            raise Exception(f"Failed to get authorization URL: {str(e)}")
+        return f"{self._auth_url_prefix}&state={quote(state, safe='')}"
     
-    def set_access_token(self, authorization_code: str) -> Dict[str, Any]:
+    def set_access_token(self, authorization_code: str) -> TokenInfo:
         """
         Exchange authorization code for access token
         
@@ -85,12 +209,10 @@ class UpstoxAuth:
             authorization_code: Code received from authorization callback
             
         Returns:
-            Token information dict
+            Token information
         """
         try:
-            login_api = LoginApi(self.api_client)
-            
-            token_response = login_api.token(
+            token_response = self.login_api.token(
                 api_version='2.0',
                 code=authorization_code,
                 client_id=self.api_key,
@@ -105,18 +227,16 @@ class UpstoxAuth:
             self.token_expires_at = "3:30 AM next trading day"
             self.config.access_token = self.access_token
             self.is_authenticated = True
+            self._profile_cache = None
             
-            return {
-                'access_token': self.access_token,
-                'expires_at': self.token_expires_at,
-                'authenticated': True,
-                'user_info': {
-                    'user_name': token_response.user_name,
-                    'email': token_response.email,
-                    'user_id': token_response.user_id,
-                    'broker': token_response.broker
-                }
-            }
+            return TokenInfo(
+                access_token=self.access_token,
+                expires_at=self.token_expires_at,
+                user_name=token_response.user_name,
+                email=token_response.email,
+                user_id=token_response.user_id,
+                broker=token_response.broker
+            )
             
         except Exception as e:
             raise Exception(f"Failed to exchange authorization code: {str(e)}")
@@ -132,21 +252,25 @@ class UpstoxAuth:
             True if token loaded successfully, False otherwise
         """
         try:
-            if os.path.exists(file_path):
-                with open(file_path, 'r') as f:
-                    token_data = json.load(f)
-                
-                self.access_token = token_data.get('access_token')
-                self.token_expires_at = token_data.get('expires_at')
-                
-                if self.access_token:
-                    self.config.access_token = self.access_token
-                    self.is_authenticated = True
-                    return True
-            
-            return False
+            token_data = load_json_cached(file_path)
+            access_token = token_data.get('access_token')
+            expires_at = token_data.get('expires_at')
         except Exception:
+            # Missing (FileNotFoundError) or malformed token file
             return False
+        
+        self.access_token = access_token
+        self.token_expires_at = expires_at
+        
+        if self.access_token:
+            # A not-yet-created config picks the token up on creation
+            if self._config is not None:
+                self._config.access_token = self.access_token
+            self.is_authenticated = True
+            self._profile_cache = None
+            return True
+        
+        return False
     
     def save_token_to_file(self, file_path: str = "upstox_token.json") -> bool:
         """
@@ -166,42 +290,53 @@ class UpstoxAuth:
                     'saved_at': datetime.now().isoformat()
                 }
                 
-                with open(file_path, 'w') as f:
-                    json.dump(token_data, f, indent=2)
+                dump_json(token_data, file_path)
                 
                 return True
             return False
         except Exception:
             return False
     
-    def get_user_profile(self) -> Dict[str, Any]:
+    def get_user_profile(self, force: bool = False) -> UserProfile:
         """
         Get user profile information
         
+        The profile is cached for PROFILE_CACHE_TTL seconds and dropped
+        whenever a new access token is set.
+        
+        Args:
+            force: Bypass the cache and fetch from the API
+        
         Returns:
-            User profile dict
+            User profile
         """
         if not self.is_authenticated:
             raise Exception("Not authenticated. Please set access token first.")
         
+        now = time.monotonic()
+        if (not force and self._profile_cache is not None
+                and now - self._profile_cache_ts < PROFILE_CACHE_TTL):
+            return self._profile_cache
+        
         try:
-            user_api = UserApi(self.api_client)
-            response = user_api.get_profile(api_version='2.0')
+            response = self.user_api.get_profile(api_version='2.0')
             
             # Profile data is nested under 'data' attribute
             profile = response.data
             
-            return {
-                'user_name': profile.user_name,
-                'email': profile.email,
-                'user_id': profile.user_id,
-                'broker': profile.broker,
-                'exchanges': profile.exchanges,
-                'products': profile.products,
-                'user_type': profile.user_type,
-                'poa': profile.poa,
-                'is_active': profile.is_active
-            }
+            self._profile_cache = UserProfile(
+                user_name=profile.user_name,
+                email=profile.email,
+                user_id=profile.user_id,
+                broker=profile.broker,
+                exchanges=tuple(profile.exchanges or ()),
+                products=tuple(profile.products or ()),
+                user_type=profile.user_type,
+                poa=profile.poa,
+                is_active=profile.is_active
+            )
+            self._profile_cache_ts = now
+            return self._profile_cache
         except Exception as e:
             raise Exception(f"Failed to get user profile: {str(e)}")
     
@@ -215,54 +350,59 @@ class UpstoxAuth:
         if not self.is_authenticated:
             raise Exception("Not authenticated. Please set access token first.")
         
+        # Per-exchange failures are reported in the value, not raised
+        return {exchange: self._exchange_status(exchange) for exchange in MARKET_EXCHANGES}
+    
+    def _exchange_status(self, exchange: str) -> str:
+        """Fetch the market status of a single exchange as a display string"""
         try:
-            market_api = MarketHolidaysAndTimingsApi(self.api_client)
-            
-            # Get status for all major exchanges
-            exchanges = ['NSE', 'BSE', 'NFO', 'BFO', 'MCX']
-            market_status = {}
-            
-            for exchange in exchanges:
-                try:
-                    response = market_api.get_market_status(exchange)
-                    # Market status response structure - use 'status' attribute
-                    if hasattr(response, 'data') and response.data:
-                        market_status[exchange] = response.data.status
-                    else:
-                        market_status[exchange] = "Unknown"
-                except Exception as e:
-                    market_status[exchange] = f"Error: {str(e)}"
-            
-            return market_status
+            response = self.market_api.get_market_status(exchange)
+            # Market status response structure - use 'status' attribute
+            if hasattr(response, 'data') and response.data:
+                return response.data.status
+            return "Unknown"
         except Exception as e:
-            raise Exception(f"Failed to get market status: {str(e)}")
+            return f"Error: {str(e)}"
     
-    def check_connection(self) -> Dict[str, Any]:
+    def get_session_snapshot(self) -> SessionSnapshot:
+        """
+        Fetch user profile and market status concurrently
+        
+        Both requests run in parallel over the shared connection pool, so
+        verifying a session costs one round trip instead of two.
+        
+        Returns:
+            SessionSnapshot with the profile (see get_user_profile) and
+            market status (see get_market_status)
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            profile_future = executor.submit(self.get_user_profile)
+            market_future = executor.submit(self.get_market_status)
+            return SessionSnapshot(
+                profile=profile_future.result(),
+                market=market_future.result()
+            )
+    
+    def check_connection(self) -> ConnectionStatus:
         """
         Check if connection is working by fetching user profile
         
         Returns:
-            Connection status dict
+            Connection status
         """
         try:
             if not self.is_authenticated:
-                return {
-                    'connected': False,
-                    'error': 'Not authenticated'
-                }
+                return ConnectionStatus(connected=False, error='Not authenticated')
             
             profile = self.get_user_profile()
-            return {
-                'connected': True,
-                'user_name': profile['user_name'],
-                'broker': profile['broker'],
-                'exchanges': profile['exchanges']
-            }
+            return ConnectionStatus(
+                connected=True,
+                user_name=profile.user_name,
+                broker=profile.broker,
+                exchanges=profile.exchanges
+            )
         except Exception as e:
-            return {
-                'connected': False,
-                'error': str(e)
-            }
+            return ConnectionStatus(connected=False, error=str(e))
 
 
 def create_upstox_client(api_key: str = None, api_secret: str = None, 
@@ -281,9 +421,8 @@ def create_upstox_client(api_key: str = None, api_secret: str = None,
     """
     client = UpstoxAuth(api_key, api_secret, redirect_uri)
     
-    # Try to load existing token
-    if os.path.exists(token_file):
-        client.load_token_from_file(token_file)
+    # Try to load existing token (a missing file is simply ignored)
+    client.load_token_from_file(token_file)
     
     return client
 
@@ -292,8 +431,7 @@ if __name__ == "__main__":
     """
     Example usage / testing
     """
-    print("🔗 Upstox Authentication Module")
-    print("=" * 40)
+    print(f"🔗 Upstox Authentication Module\n{'=' * 40}")
     
     try:
         # Create client (you need to set environment variables or pass credentials)
@@ -302,19 +440,19 @@ if __name__ == "__main__":
         if client.is_authenticated:
             print("✅ Already authenticated with saved token")
             
-            # Test connection
-            connection = client.check_connection()
-            if connection['connected']:
-                print(f"👤 Connected as: {connection['user_name']}")
-                print(f"🏦 Broker: {connection['broker']}")
+            # Test connection and fetch market status in one go
+            try:
+                snapshot = client.get_session_snapshot()
+            except Exception as e:
+                print(f"❌ Connection failed: {e}")
+            else:
+                profile = snapshot.profile
+                print(f"👤 Connected as: {profile.user_name}")
+                print(f"🏦 Broker: {profile.broker}")
                 
-                # Get market status
-                market_status = client.get_market_status()
                 print("\n📊 Market Status:")
-                for exchange, status in market_status.items():
+                for exchange, status in snapshot.market.items():
                     print(f"  {exchange}: {status}")
-            else:
-                print(f"❌ Connection failed: {connection['error']}")
         else:
             print("🔐 Not authenticated. Starting OAuth flow...")
             
@@ -326,9 +464,11 @@ if __name__ == "__main__":
             
     except ValueError as e:
         print(f"❌ Configuration error: {e}")
-        print("\n💡 To use this module, set environment variables:")
-        print("   export UPSTOX_API_KEY='your_api_key'")
-        print("   export UPSTOX_API_SECRET='your_api_secret'")
-        print("   export UPSTOX_REDIRECT_URI='http://localhost:8080'  # optional")
+        print(
+            "\n💡 To use this module, set environment variables:\n"
+            "   export UPSTOX_API_KEY='your_api_key'\n"
+            "   export UPSTOX_API_SECRET='your_api_secret'\n"
+            "   export UPSTOX_REDIRECT_URI='http://localhost:8080'  # optional"
+        )
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -3,17 +3,86 @@ Upstox MCP Server
 Provides trading and market data tools via Model Context Protocol
 """
 
+import asyncio
+import functools
+import inspect
+import logging
+import mmap
+import os
+import pickle
+import sys
+import threading
+import time
+from bisect import bisect_right
+from operator import attrgetter, mul
+from concurrent.futures import Future, ThreadPoolExecutor
 from mcp.server.fastmcp import FastMCP
 import upstox_client
 from upstox_client.rest import ApiException
-from config import configuration, api_version
-import json
+from config import get_api, api_version, REQUEST_TIMEOUT
+from json_utils import load_json, write_atomic
+from cache_utils import TTLCache
+from metrics import instrumented, metrics
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, Hashable, List, NamedTuple, Tuple
 
 # Create MCP server
 mcp = FastMCP("Upstox Trading Server")
 
+logger = logging.getLogger(__name__)
+
+# Formatted tool responses. The profile is effectively static for a session;
+# holdings and positions use a short TTL so P&L stays fresh.
+PORTFOLIO_CACHE_TTL = 5
+_profile_cache = TTLCache(ttl=300, maxsize=8)
+_portfolio_cache = TTLCache(ttl=PORTFOLIO_CACHE_TTL, maxsize=8)
+
+# Portfolio cache keys whose current entry was stored by the prefetcher, so
+# hits on them can be counted as prefetch hits
+_prefetched = set()
+
+# Last traded price (float) per instrument key
+_ltp_cache = TTLCache(ttl=5, maxsize=4096)
+
+# Formatted full market quote per instrument key
+_quote_cache = TTLCache(ttl=2, maxsize=1024)
+
+# Seconds between the starts of background refreshes of holdings, positions
+# and the LTPs of held instruments; 0 disables the prefetcher. The default
+# is a second under the portfolio cache TTL, so each entry is replaced
+# before it expires as long as a refresh takes less than that margin.
+PREFETCH_INTERVAL = float(
+    os.getenv('UPSTOX_PREFETCH_INTERVAL', str(PORTFOLIO_CACHE_TTL - 1))
+)
+
+# The prefetcher pauses once no broker-backed tool (see mcp_tool) has been
+# called for this many seconds, so an idle server doesn't poll the broker
+# around the clock; the next such call wakes it up
+PREFETCH_IDLE_TIMEOUT = float(os.getenv('UPSTOX_PREFETCH_IDLE_TIMEOUT', '300'))
+
+# time.monotonic() of the latest broker-backed tool call (-inf until the
+# first one, since monotonic time starts near zero at boot), and an event
+# set on each such call so a paused prefetcher can resume immediately
+_last_broker_call = float('-inf')
+_broker_called = threading.Event()
+
+# Maximum instrument keys per LTP request accepted by the Upstox API
+LTP_BATCH_SIZE = 500
+
+# Worker threads for blocking Upstox SDK calls, so tools never stall the
+# server's event loop and independent requests can run concurrently
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="upstox")
+
+# Upper bound (seconds) a tool waits for a blocking Upstox call. Waiting
+# stops here, but the worker is only freed when the HTTP request itself
+# times out, which the shared client enforces with REQUEST_TIMEOUT.
+API_TIMEOUT = REQUEST_TIMEOUT
+
+# Blocking calls currently running on _executor, by request key, so identical
+# concurrent requests share a single API call
+_inflight: Dict[Hashable, Future] = {}
+_inflight_lock = threading.Lock()
+
 # ============================================================================
 # Helper Functions
 # ============================================================================
@@ -31,49 +100,322 @@ def handle_api_error(e: Exception, context: str = "API operation") -> str:
     """
     if isinstance(e, ApiException):
         return f"❌ API Error during {context}: {e.status} - {e.reason}"
+    if isinstance(e, TimeoutError):
+        return f"❌ Timed out during {context} after {API_TIMEOUT}s"
     return f"❌ Error during {context}: {str(e)}"
 
 
-def load_stock_data() -> Optional[Dict[str, Any]]:
+def mcp_tool(context: str, broker: bool = False) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Decorator for MCP tool functions, applied under @mcp.tool()
+    
+    Records the tool's timing in the server metrics and turns any exception
+    into a handle_api_error message. Works with both sync and async tools.
+    
+    Args:
+        context: What the tool was doing, for error messages
+            (e.g. "fetching holdings")
+        broker: Whether the tool reads portfolio or market data from Upstox;
+            such calls keep the background prefetcher running, while local
+            tools (stock search, cache control) leave it paused
+    """
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args: Any, **kwargs: Any) -> Any:
+                if broker:
+                    note_broker_activity()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    return handle_api_error(e, context)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                if broker:
+                    note_broker_activity()
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    return handle_api_error(e, context)
+        return instrumented(func.__name__)(wrapper)
+    
+    return decorator
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any) -> Any:
     """
-    Load categorized stock data from JSON file
+    Run a blocking SDK call on the worker pool and await its result
+    
+    Raises:
+        TimeoutError: If the call takes longer than API_TIMEOUT seconds
+    """
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(
+        loop.run_in_executor(_executor, functools.partial(func, *args)),
+        timeout=API_TIMEOUT
+    )
+
+
+def submit_coalesced(key: Hashable, func: Callable[..., Any], *args: Any) -> Future:
+    """
+    Submit func(*args) to the worker pool unless a call for key is running
     
     Returns:
-        Dictionary with categorized stocks or None if failed
+        The in-flight Future for key, shared with any concurrent callers
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future
+        future = _executor.submit(func, *args)
+        _inflight[key] = future
+    
+    def _done(done: Future) -> None:
+        with _inflight_lock:
+            if _inflight.get(key) is done:
+                del _inflight[key]
+    
+    future.add_done_callback(_done)
+    return future
+
+
+async def run_coalesced(key: Hashable, func: Callable[..., Any], *args: Any) -> Any:
     """
+    Like run_blocking, but concurrent calls with the same key share one call
+    
+    A caller that times out stops waiting without cancelling the shared call.
+    
+    Raises:
+        TimeoutError: If the call takes longer than API_TIMEOUT seconds
+    """
+    future = asyncio.wrap_future(submit_coalesced(key, func, *args))
+    return await asyncio.wait_for(asyncio.shield(future), timeout=API_TIMEOUT)
+
+
+async def load_cached(cache: TTLCache, key: str, loader: Callable[[], Any]) -> Any:
+    """Return a cached value, running the blocking loader off-loop on a miss"""
+    value = cache.get(key)
+    if value is None:
+        metrics.incr("cache_misses")
+        _prefetched.discard(key)
+        value = await run_blocking(cache.get_or_set, key, loader)
+    else:
+        metrics.incr("cache_hits")
+        if key in _prefetched:
+            metrics.incr("prefetch_hits")
+    return value
+
+
+def _freeze(obj: Any) -> Any:
+    """Recursively intern strings and convert lists to tuples"""
+    if isinstance(obj, dict):
+        return {sys.intern(key): _freeze(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return tuple(_freeze(item) for item in obj)
+    if isinstance(obj, str):
+        return sys.intern(obj)
+    return obj
+
+
+STOCK_DATA_FILE = Path(__file__).parent / "categorized_stocks.json"
+# Pickled (stamp, data, index fields) built from STOCK_DATA_FILE, where stamp
+# is STOCK_CACHE_VERSION plus the JSON file's (mtime_ns, size) so edits to
+# the JSON or to the cached layout invalidate it.
+# The index is stored as a plain tuple so the pickle doesn't depend on
+# whether this module runs as __main__ or is imported.
+STOCK_CACHE_FILE = STOCK_DATA_FILE.with_name("categorized_stocks.cache.pkl")
+
+# Bump whenever _freeze, _build_stock_index or StockIndex changes what is
+# cached, so sidecars written by older code are rebuilt instead of reused
+STOCK_CACHE_VERSION = 1
+
+
+def _read_stock_data() -> Optional[Dict[str, Any]]:
+    """Read and freeze categorized_stocks.json, or None if unavailable"""
     try:
-        json_path = Path(__file__).parent / "categorized_stocks.json"
-        if not json_path.exists():
-            return None
-        
-        with open(json_path, 'r') as f:
-            return json.load(f)
+        return _freeze(load_json(STOCK_DATA_FILE))
     except Exception:
         return None
 
 
+# Separates fields and rows in the search corpus; it never occurs in stock
+# data, so a match cannot span two fields
+_CORPUS_SEP = "\x00"
+
+
+class StockIndex(NamedTuple):
+    """Lookup structures derived from the categorized stock data"""
+    # Upper-cased symbol -> stock entries with that symbol
+    by_symbol: Dict[str, Tuple[Dict[str, str], ...]]
+    # All stock entries (symbol, instrument_key, name, category) in file order
+    entries: Tuple[Dict[str, str], ...]
+    # Lower-cased "symbol<SEP>name<SEP>" of every entry, concatenated
+    corpus: str
+    # Offset of each entry in corpus, plus a final len(corpus) sentinel
+    starts: Tuple[int, ...]
+
+
+def _build_stock_index(categorized_stocks: Optional[Dict[str, Any]]) -> StockIndex:
+    """Flatten categorized stocks into lookup structures for the search tools"""
+    by_symbol = {}
+    entries = []
+    parts = []
+    starts = []
+    offset = 0
+    for category, stocks in (categorized_stocks or {}).items():
+        for stock in stocks:
+            entry = {
+                'symbol': stock['symbol'],
+                'instrument_key': stock['instrument_key'],
+                'name': stock.get('name', 'N/A'),
+                'category': category
+            }
+            by_symbol.setdefault(stock['symbol'].upper(), []).append(entry)
+            entries.append(entry)
+            
+            row = f"{stock['symbol']}{_CORPUS_SEP}{stock.get('name', '')}{_CORPUS_SEP}".lower()
+            starts.append(offset)
+            parts.append(row)
+            offset += len(row)
+    starts.append(offset)
+    
+    return StockIndex(
+        by_symbol={symbol: tuple(found) for symbol, found in by_symbol.items()},
+        entries=tuple(entries),
+        corpus="".join(parts),
+        starts=tuple(starts)
+    )
+
+
+def find_stocks(search_term: str, limit: int) -> List[Dict[str, str]]:
+    """
+    Find stocks whose symbol or name contains search_term (case-insensitive)
+    
+    Scans the concatenated corpus with str.find, so the per-stock work
+    happens in C; after a hit the scan resumes at the next stock, so each
+    stock is returned at most once, in file order.
+    
+    Args:
+        search_term: Substring to look for
+        limit: Stop after this many matches (at least one is returned)
+    
+    Returns:
+        Matching stock entries
+    """
+    needle = search_term.lower()
+    if _CORPUS_SEP in needle:
+        return []
+    
+    corpus, starts, entries = STOCK_INDEX.corpus, STOCK_INDEX.starts, STOCK_INDEX.entries
+    matches = []
+    pos = 0
+    while True:
+        hit = corpus.find(needle, pos)
+        if hit < 0:
+            break
+        row = bisect_right(starts, hit) - 1
+        if row >= len(entries):
+            # Empty search term matched at the very end of the corpus
+            break
+        matches.append(entries[row])
+        if len(matches) >= limit:
+            break
+        pos = starts[row + 1]
+    return matches
+
+
+def _load_stock_tables() -> Tuple[Optional[Dict[str, Any]], StockIndex]:
+    """
+    Load the categorized stock data and its index
+    
+    Reuses the pickled sidecar when it matches STOCK_CACHE_VERSION and the
+    JSON file on disk; otherwise parses the JSON, builds the index and
+    rewrites the sidecar.
+    The sidecar is only an optimization, so any problem reading or writing
+    it falls back to the JSON.
+    """
+    try:
+        st = STOCK_DATA_FILE.stat()
+    except OSError:
+        return None, _build_stock_index(None)
+    stamp = (STOCK_CACHE_VERSION, st.st_mtime_ns, st.st_size)
+    
+    try:
+        with open(STOCK_CACHE_FILE, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            cached_stamp, data, fields = pickle.loads(mm)
+        if cached_stamp == stamp:
+            return data, StockIndex(*fields)
+    except Exception:
+        pass
+    
+    data = _read_stock_data()
+    index = _build_stock_index(data)
+    if data is not None:
+        try:
+            write_atomic(
+                pickle.dumps((stamp, data, tuple(index)), protocol=pickle.HIGHEST_PROTOCOL),
+                STOCK_CACHE_FILE
+            )
+        except Exception as e:
+            logger.debug("Could not write stock cache %s: %s", STOCK_CACHE_FILE, e)
+    return data, index
+
+
+# Categorized stock data and its indexes, loaded once at import and shared
+# by all tools
+STOCK_DATA, STOCK_INDEX = _load_stock_tables()
+
+
+def load_stock_data() -> Optional[Dict[str, Any]]:
+    """
+    Return the categorized stock data loaded at import
+    
+    Returns:
+        Dictionary with categorized stocks (category -> tuple of stocks)
+        or None if failed
+    """
+    return STOCK_DATA
+
+
+# Bound format methods shared by the formatters below
+_CURRENCY_FMT = "₹{:,.2f}".format
+_PERCENTAGE_FMT = "{:+.2f}%".format
+
+
 def format_currency(amount: float) -> str:
     """Format currency with Indian numbering system"""
-    return f"₹{amount:,.2f}"
+    return _CURRENCY_FMT(amount)
 
 
 def format_percentage(value: float) -> str:
     """Format percentage with sign"""
-    return f"{value:+.2f}%"
+    return _PERCENTAGE_FMT(value)
 
 # ============================================================================
 # User Profile & Portfolio Tools
 # ============================================================================
 
 @mcp.tool()
-def get_user_profile() -> str:
+@mcp_tool("fetching user profile", broker=True)
+async def get_user_profile() -> str:
     """Get Upstox user profile information"""
-    try:
-        api_instance = upstox_client.UserApi(upstox_client.ApiClient(configuration))
-        response = api_instance.get_profile(api_version)
-        profile = response.data
-        
-        return f"""👤 User Profile:
+    profile = await load_cached(_profile_cache, "profile", _fetch_user_profile)
+    
+    # Holdings and positions are usually requested next; warm them now
+    if PREFETCH_INTERVAL > 0 and _portfolio_cache.get("holdings") is None:
+        _executor.submit(_prefetch_portfolio)
+    return profile
+
+
+def _fetch_user_profile() -> str:
+    """Fetch and format the user profile"""
+    api_instance = get_api(upstox_client.UserApi)
+    response = api_instance.get_profile(api_version)
+    profile = response.data
+    
+    return f"""👤 User Profile:
 Name: {profile.user_name}
 Email: {profile.email}
 User ID: {profile.user_id}
@@ -84,110 +426,263 @@ Order Types: {', '.join(profile.order_types)}
 User Type: {profile.user_type}
 POA Status: {profile.poa}
 Active: {profile.is_active}"""
-        
-    except Exception as e:
-        return handle_api_error(e, "fetching user profile")
 
 
 @mcp.tool()
-def get_holdings() -> str:
+@mcp_tool("fetching holdings", broker=True)
+async def get_holdings() -> str:
     """Get Upstox portfolio holdings"""
-    try:
-        api_instance = upstox_client.PortfolioApi(upstox_client.ApiClient(configuration))
-        response = api_instance.get_holdings(api_version)
-        holdings = response.data
-        
-        if not holdings:
-            return "📊 No holdings found in your portfolio."
-        
-        result = f"📊 Portfolio Holdings ({len(holdings)} stocks):\n\n"
-        total_investment = 0
-        total_current_value = 0
-        
-        for holding in holdings:
-            investment_value = holding.average_price * holding.quantity
-            current_value = holding.last_price * holding.quantity
-            total_investment += investment_value
-            total_current_value += current_value
-            
-            result += f"""🏢 {holding.company_name} ({holding.trading_symbol})
-   Quantity: {holding.quantity}
-   Avg Price: {format_currency(holding.average_price)}
-   Last Price: {format_currency(holding.last_price)}
-   Investment: {format_currency(investment_value)}
-   Current Value: {format_currency(current_value)}
-   P&L: {format_currency(holding.pnl)}
-   Day Change: {format_percentage(holding.day_change_percentage)}
-   Exchange: {holding.exchange}
-   
-"""
-        
-        total_pnl = total_current_value - total_investment
-        pnl_percentage = (total_pnl / total_investment * 100) if total_investment > 0 else 0
-        
-        result += f"""💰 Portfolio Summary:
-Total Investment: {format_currency(total_investment)}
-Current Value: {format_currency(total_current_value)}
-Total P&L: {format_currency(total_pnl)} ({format_percentage(pnl_percentage)})"""
-        
-        return result
-        
-    except Exception as e:
-        return handle_api_error(e, "fetching holdings")
+    return await load_cached(_portfolio_cache, "holdings", _fetch_holdings)
+
+
+def _fetch_holdings() -> str:
+    """Fetch and format holdings"""
+    api_instance = get_api(upstox_client.PortfolioApi)
+    response = api_instance.get_holdings(api_version)
+    return _format_holdings(response.data)
+
+
+# Fixed responses for an empty portfolio
+_NO_HOLDINGS = "📊 No holdings found in your portfolio."
+_NO_POSITIONS = "📈 No open positions found."
+
+# Row and summary templates for the portfolio tools. Currency and
+# percentage specs match format_currency/format_percentage.
+_HOLDING_ROW = (
+    "🏢 {h.company_name} ({h.trading_symbol})\n"
+    "   Quantity: {h.quantity}\n"
+    "   Avg Price: ₹{h.average_price:,.2f}\n"
+    "   Last Price: ₹{h.last_price:,.2f}\n"
+    "   Investment: ₹{investment:,.2f}\n"
+    "   Current Value: ₹{current_value:,.2f}\n"
+    "   P&L: ₹{h.pnl:,.2f}\n"
+    "   Day Change: {h.day_change_percentage:+.2f}%\n"
+    "   Exchange: {h.exchange}\n"
+    "   \n"
+).format
+_HOLDINGS_SUMMARY = (
+    "💰 Portfolio Summary:\n"
+    "Total Investment: ₹{investment:,.2f}\n"
+    "Current Value: ₹{current_value:,.2f}\n"
+    "Total P&L: ₹{pnl:,.2f} ({pnl_percentage:+.2f}%)"
+).format
+_POSITION_ROW = (
+    "📊 {p.trading_symbol} ({p.exchange}) {status}\n"
+    "   Quantity: {p.quantity}\n"
+    "   Buy Price: ₹{buy_price:,.2f}\n"
+    "   Sell Price: ₹{sell_price:,.2f}\n"
+    "   Last Price: ₹{p.last_price:,.2f}\n"
+    "   Value: ₹{p.value:,.2f}\n"
+    "   P&L: ₹{p.pnl:,.2f}\n"
+    "   Unrealised: ₹{p.unrealised:,.2f}\n"
+    "   Realised: ₹{p.realised:,.2f}\n"
+    "   Product: {p.product}\n"
+    "   \n"
+).format
+_POSITIONS_SUMMARY = (
+    "💹 Positions Summary:\n"
+    "Total P&L: ₹{pnl:,.2f}\n"
+    "Total Unrealised: ₹{unrealised:,.2f}\n"
+    "Total Realised: ₹{realised:,.2f}"
+).format
+
+
+# Per-row fields summed into the totals; attrgetter/map/sum keep the
+# arithmetic in C instead of a Python-level accumulation loop
+_HOLDING_QUANTITY = attrgetter('quantity')
+_HOLDING_AVERAGE_PRICE = attrgetter('average_price')
+_HOLDING_LAST_PRICE = attrgetter('last_price')
+_POSITION_TOTALS = attrgetter('pnl', 'unrealised', 'realised')
+
+
+def _format_holdings(holdings) -> str:
+    """Format holdings returned by the portfolio API"""
+    if not holdings:
+        return _NO_HOLDINGS
+    
+    quantities = list(map(_HOLDING_QUANTITY, holdings))
+    investments = list(map(mul, map(_HOLDING_AVERAGE_PRICE, holdings), quantities))
+    current_values = list(map(mul, map(_HOLDING_LAST_PRICE, holdings), quantities))
+    total_investment = sum(investments)
+    total_current_value = sum(current_values)
+    
+    parts = [f"📊 Portfolio Holdings ({len(holdings)} stocks):\n\n"]
+    parts += [
+        _HOLDING_ROW(h=holding, investment=investment_value, current_value=current_value)
+        for holding, investment_value, current_value in zip(holdings, investments, current_values)
+    ]
+    
+    total_pnl = total_current_value - total_investment
+    pnl_percentage = (total_pnl / total_investment * 100) if total_investment > 0 else 0
+    
+    parts.append(_HOLDINGS_SUMMARY(
+        investment=total_investment,
+        current_value=total_current_value,
+        pnl=total_pnl,
+        pnl_percentage=pnl_percentage
+    ))
+    
+    return "".join(parts)
 
 
 @mcp.tool()
-def get_positions() -> str:
+@mcp_tool("fetching positions", broker=True)
+async def get_positions() -> str:
     """Get Upstox trading positions"""
-    try:
-        api_instance = upstox_client.PortfolioApi(upstox_client.ApiClient(configuration))
-        response = api_instance.get_positions(api_version)
-        positions = response.data
-        
-        if not positions:
-            return "📈 No open positions found."
-        
-        result = f"📈 Trading Positions ({len(positions)} positions):\n\n"
-        total_pnl = 0
-        total_unrealised = 0
-        total_realised = 0
-        
-        for position in positions:
-            total_pnl += position.pnl
-            total_unrealised += position.unrealised
-            total_realised += position.realised
-            
-            status = "✅ CLOSED" if position.quantity == 0 else "🔄 OPEN"
-            
-            result += f"""📊 {position.trading_symbol} ({position.exchange}) {status}
-   Quantity: {position.quantity}
-   Buy Price: {format_currency(position.buy_price if position.buy_price else 0)}
-   Sell Price: {format_currency(position.sell_price if position.sell_price else 0)}
-   Last Price: {format_currency(position.last_price)}
-   Value: {format_currency(position.value)}
-   P&L: {format_currency(position.pnl)}
-   Unrealised: {format_currency(position.unrealised)}
-   Realised: {format_currency(position.realised)}
-   Product: {position.product}
-   
-"""
-        
-        result += f"""💹 Positions Summary:
-Total P&L: {format_currency(total_pnl)}
-Total Unrealised: {format_currency(total_unrealised)}
-Total Realised: {format_currency(total_realised)}"""
-        
-        return result
-        
-    except Exception as e:
-        return handle_api_error(e, "fetching positions")
+    return await load_cached(_portfolio_cache, "positions", _fetch_positions)
+
+
+def _fetch_positions() -> str:
+    """Fetch and format positions"""
+    api_instance = get_api(upstox_client.PortfolioApi)
+    response = api_instance.get_positions(api_version)
+    return _format_positions(response.data)
+
+
+def _format_positions(positions) -> str:
+    """Format positions returned by the portfolio API"""
+    if not positions:
+        return _NO_POSITIONS
+    
+    total_pnl, total_unrealised, total_realised = map(sum, zip(*map(_POSITION_TOTALS, positions)))
+    
+    parts = [f"📈 Trading Positions ({len(positions)} positions):\n\n"]
+    parts += [
+        _POSITION_ROW(
+            p=position,
+            status="✅ CLOSED" if position.quantity == 0 else "🔄 OPEN",
+            buy_price=position.buy_price if position.buy_price else 0,
+            sell_price=position.sell_price if position.sell_price else 0
+        )
+        for position in positions
+    ]
+    
+    parts.append(_POSITIONS_SUMMARY(
+        pnl=total_pnl,
+        unrealised=total_unrealised,
+        realised=total_realised
+    ))
+    
+    return "".join(parts)
+
+
+@mcp.tool()
+@mcp_tool("fetching portfolio snapshot", broker=True)
+async def get_portfolio_snapshot() -> str:
+    """Get user profile, holdings and positions together in one call
+    
+    The three requests are issued concurrently, so this takes roughly as
+    long as the slowest of them. Results also warm the caches used by the
+    individual tools.
+    """
+    results = await asyncio.gather(
+        load_cached(_profile_cache, "profile", _fetch_user_profile),
+        load_cached(_portfolio_cache, "holdings", _fetch_holdings),
+        load_cached(_portfolio_cache, "positions", _fetch_positions),
+        return_exceptions=True
+    )
+    contexts = ("fetching user profile", "fetching holdings", "fetching positions")
+    
+    return "\n\n".join(
+        handle_api_error(result, context) if isinstance(result, Exception) else result
+        for result, context in zip(results, contexts)
+    )
+
+
+@mcp.tool()
+@mcp_tool("clearing portfolio cache")
+def invalidate_portfolio_cache() -> str:
+    """Clear cached profile, holdings and positions so the next call fetches fresh data
+    
+    Call this after placing or modifying orders.
+    """
+    _profile_cache.clear()
+    _portfolio_cache.clear()
+    return "🧹 Portfolio cache cleared."
+
+# ============================================================================
+# Background Prefetch
+# ============================================================================
+
+def _prefetch_portfolio() -> None:
+    """Refresh cached holdings and positions, then the LTPs of held instruments"""
+    portfolio_api = get_api(upstox_client.PortfolioApi)
+    holdings = portfolio_api.get_holdings(api_version).data
+    _portfolio_cache.set("holdings", _format_holdings(holdings))
+    _prefetched.add("holdings")
+    positions = portfolio_api.get_positions(api_version).data
+    _portfolio_cache.set("positions", _format_positions(positions))
+    _prefetched.add("positions")
+    
+    instrument_keys = [h.instrument_token for h in holdings or () if h.instrument_token]
+    if instrument_keys:
+        _fetch_ltps(instrument_keys)
+
+
+def note_broker_activity() -> None:
+    """Record a broker-backed tool call, waking the prefetcher if it is paused"""
+    global _last_broker_call
+    _last_broker_call = time.monotonic()
+    _broker_called.set()
+
+
+def _is_idle() -> bool:
+    """Whether no broker-backed tool has been called within PREFETCH_IDLE_TIMEOUT"""
+    return time.monotonic() - _last_broker_call > PREFETCH_IDLE_TIMEOUT
+
+
+def _prefetch_loop(interval: float) -> None:
+    """
+    Run _prefetch_portfolio every interval seconds while tools are in use
+    
+    Runs are scheduled relative to when the previous one started, so the
+    time spent in API calls doesn't stretch the interval. While the server
+    is idle the loop blocks until the next broker-backed tool call.
+    """
+    while True:
+        if _is_idle():
+            _broker_called.clear()
+            # Re-check after clearing, so a call in between isn't missed
+            if _is_idle():
+                _broker_called.wait()
+            continue
+        
+        started = time.monotonic()
+        metrics.incr("prefetch_runs")
+        try:
+            _prefetch_portfolio()
+        except Exception:
+            metrics.incr("prefetch_errors")
+            # Typically no token yet or a transient API error; tools will
+            # surface real errors when they fetch on a cache miss
+            logger.debug("Portfolio prefetch failed", exc_info=True)
+        time.sleep(max(0.0, started + interval - time.monotonic()))
+
+
+def start_prefetcher() -> Optional[threading.Thread]:
+    """Start the background prefetch thread unless PREFETCH_INTERVAL is 0"""
+    if PREFETCH_INTERVAL <= 0:
+        return None
+    thread = threading.Thread(
+        target=_prefetch_loop,
+        args=(PREFETCH_INTERVAL,),
+        name="upstox-prefetch",
+        daemon=True
+    )
+    thread.start()
+    return thread
 
 # ============================================================================
 # Market Data Tools
 # ============================================================================
 
+_NO_PRICE_TMPL = "❌ No price data available for instrument key: {}".format
+_NO_MARKET_DATA_TMPL = "❌ No market data available for instrument key: {}".format
+
+
 @mcp.tool()
-def get_stock_price(instrument_key: str) -> str:
+@mcp_tool("fetching stock price", broker=True)
+async def get_stock_price(instrument_key: str) -> str:
     """Get the current stock price for a given instrument key
     
     Args:
@@ -196,26 +691,102 @@ def get_stock_price(instrument_key: str) -> str:
     Returns:
         Current stock price information
     """
-    try:
-        market_api = upstox_client.MarketQuoteApi(upstox_client.ApiClient(configuration))
-        response = market_api.ltp(symbol=instrument_key, api_version=api_version)
-        
-        if response.status == 'success' and response.data:
-            for key, price_data in response.data.items():
-                return f"""📈 Current Stock Price:
+    last_price = (await get_ltps([instrument_key])).get(instrument_key)
+    
+    if last_price is None:
+        return _NO_PRICE_TMPL(instrument_key)
+    
+    return f"""📈 Current Stock Price:
 
 Instrument Key: {instrument_key}
-Last Price: {format_currency(price_data.last_price)}
+Last Price: {format_currency(last_price)}
 Status: Active ✅"""
-        
-        return f"❌ No price data available for instrument key: {instrument_key}"
-        
-    except Exception as e:
-        return handle_api_error(e, "fetching stock price")
 
 
 @mcp.tool()
-def get_full_market_quote(instrument_key: str) -> str:
+@mcp_tool("fetching stock prices", broker=True)
+async def get_stock_prices(instrument_keys: List[str]) -> str:
+    """Get current stock prices for several instrument keys in one request
+    
+    Args:
+        instrument_keys: Instrument keys (e.g., ['NSE_EQ|INE009A01021', 'NSE_EQ|INE467B01029'])
+    
+    Returns:
+        Last price for each instrument
+    """
+    # Each instrument is listed once, in the order first requested
+    instrument_keys = list(dict.fromkeys(instrument_keys))
+    prices = await get_ltps(instrument_keys)
+    
+    parts = [f"📈 Current Stock Prices ({len(prices)} of {len(instrument_keys)} found):\n\n"]
+    for instrument_key in instrument_keys:
+        last_price = prices.get(instrument_key)
+        if last_price is None:
+            parts.append(f"{instrument_key}: ❌ No price data\n")
+        else:
+            parts.append(f"{instrument_key}: {_CURRENCY_FMT(last_price)}\n")
+    
+    return "".join(parts)
+
+
+async def get_ltps(instrument_keys: List[str]) -> Dict[str, float]:
+    """
+    Return last traded prices, fetching only uncached keys from the API
+    
+    Missing keys are requested together in as few LTP calls as possible,
+    and concurrent requests for the same missing keys share one fetch.
+    
+    Returns:
+        Mapping of instrument key to last price (keys without data are omitted)
+    """
+    prices = {}
+    missing = []
+    for instrument_key in dict.fromkeys(instrument_keys):
+        last_price = _ltp_cache.get(instrument_key)
+        if last_price is None:
+            missing.append(instrument_key)
+        else:
+            prices[instrument_key] = last_price
+    metrics.incr("ltp_cache_hits", len(prices))
+    metrics.incr("ltp_cache_misses", len(missing))
+    
+    if missing:
+        prices.update(await run_coalesced(("ltp", *missing), _fetch_ltps, missing))
+    return prices
+
+
+def _fetch_ltps(instrument_keys: List[str]) -> Dict[str, float]:
+    """
+    Fetch and cache last traded prices for many instruments
+    
+    Keys are sent in batches of LTP_BATCH_SIZE per request.
+    
+    Returns:
+        Mapping of instrument key to last price (missing keys are omitted)
+    """
+    market_api = get_api(upstox_client.MarketQuoteApi)
+    prices = {}
+    
+    for start in range(0, len(instrument_keys), LTP_BATCH_SIZE):
+        batch = instrument_keys[start:start + LTP_BATCH_SIZE]
+        response = market_api.ltp(symbol=",".join(batch), api_version=api_version)
+        if response.status != 'success' or not response.data:
+            continue
+        # Response keys are 'EXCHANGE:SYMBOL'; the instrument key is in the data
+        for price_data in response.data.values():
+            instrument_key = getattr(price_data, 'instrument_token', None)
+            if len(batch) == 1:
+                instrument_key = batch[0]
+            if instrument_key:
+                prices[instrument_key] = price_data.last_price
+                _ltp_cache.set(instrument_key, price_data.last_price)
+    
+    return prices
+
+
+@mcp.tool()
+@mcp_tool("fetching full market quote", broker=True)
+async def get_full_market_quote(instrument_key: str) -> str:
     """Get detailed market quote including OHLC data for a given instrument key
     
     Args:
@@ -224,22 +795,34 @@ def get_full_market_quote(instrument_key: str) -> str:
     Returns:
         Detailed market information including open, high, low, close, volume
     """
-    try:
-        market_api = upstox_client.MarketQuoteApi(upstox_client.ApiClient(configuration))
-        response = market_api.get_full_market_quote(
-            symbol=instrument_key,
-            api_version=api_version
+    result = _quote_cache.get(instrument_key)
+    if result is None:
+        metrics.incr("cache_misses")
+        result = await run_coalesced(
+            ("quote", instrument_key), _fetch_full_market_quote, instrument_key
         )
-        
-        if response.status == 'success' and response.data:
-            for key, quote_data in response.data.items():
-                ohlc = quote_data.ohlc
-                
-                # Calculate day change
-                day_change = ohlc.close - ohlc.open if ohlc.close and ohlc.open else 0
-                day_change_pct = (day_change / ohlc.open * 100) if ohlc.open and ohlc.open != 0 else 0
-                
-                result = f"""📊 Full Market Quote:
+    else:
+        metrics.incr("cache_hits")
+    return result
+
+
+def _fetch_full_market_quote(instrument_key: str) -> str:
+    """Fetch, format and cache the full market quote for an instrument key"""
+    market_api = get_api(upstox_client.MarketQuoteApi)
+    response = market_api.get_full_market_quote(
+        symbol=instrument_key,
+        api_version=api_version
+    )
+    
+    if response.status == 'success' and response.data:
+        for key, quote_data in response.data.items():
+            ohlc = quote_data.ohlc
+            
+            # Calculate day change
+            day_change = ohlc.close - ohlc.open if ohlc.close and ohlc.open else 0
+            day_change_pct = (day_change / ohlc.open * 100) if ohlc.open and ohlc.open != 0 else 0
+            
+            result = f"""📊 Full Market Quote:
 
 Instrument Key: {instrument_key}
 
@@ -259,19 +842,39 @@ Instrument Key: {instrument_key}
 ⏰ Last Update: {quote_data.last_trade_time if hasattr(quote_data, 'last_trade_time') else 'N/A'}
 
 Status: Active ✅"""
-                
-                return result
-        
-        return f"❌ No market data available for instrument key: {instrument_key}"
-        
-    except Exception as e:
-        return handle_api_error(e, "fetching full market quote")
+            
+            _quote_cache.set(instrument_key, result)
+            return result
+    
+    return _NO_MARKET_DATA_TMPL(instrument_key)
 
 # ============================================================================
 # Stock Search Tools
 # ============================================================================
 
+# Fixed and templated responses for the search tools
+_STOCK_DATA_MISSING = "❌ Error: Stock data not available"
+_STOCK_MISSING_TMPL = "❌ Stock symbol '{}' not found in the database".format
+_NO_SEARCH_MATCHES_TMPL = "❌ No stocks found matching '{}'".format
+
+# Row templates for the search tools, filled from StockIndex entries
+_INSTRUMENT_MATCH_ROW = (
+    "{idx}. Symbol: {symbol}\n"
+    "   Name: {name}\n"
+    "   Instrument Key: {instrument_key}\n"
+    "   Category: {category}\n"
+    "\n"
+).format
+_SEARCH_RESULT_ROW = (
+    "{idx}. {symbol} - {name}\n"
+    "   Instrument Key: {instrument_key}\n"
+    "   Category: {category}\n"
+    "\n"
+).format
+
+
 @mcp.tool()
+@mcp_tool("searching for instrument")
 def get_instrument_key(symbol: str) -> str:
     """Get the instrument key for a stock symbol
     
@@ -281,55 +884,37 @@ def get_instrument_key(symbol: str) -> str:
     Returns:
         The instrument key and company name for the stock
     """
-    try:
-        categorized_stocks = load_stock_data()
-        
-        if not categorized_stocks:
-            return "❌ Error: Stock data not available"
-        
-        # Search through all categories for the symbol
-        symbol_upper = symbol.upper()
-        found_stocks = []
-        
-        for category, stocks in categorized_stocks.items():
-            for stock in stocks:
-                if stock['symbol'].upper() == symbol_upper:
-                    found_stocks.append({
-                        'symbol': stock['symbol'],
-                        'instrument_key': stock['instrument_key'],
-                        'name': stock.get('name', 'N/A'),
-                        'category': category
-                    })
-        
-        if not found_stocks:
-            return f"❌ Stock symbol '{symbol}' not found in the database"
-        
-        # Single match
-        if len(found_stocks) == 1:
-            stock = found_stocks[0]
-            return f"""🔑 Instrument Key Found:
+    categorized_stocks = load_stock_data()
+    
+    if not categorized_stocks:
+        return _STOCK_DATA_MISSING
+    
+    found_stocks = STOCK_INDEX.by_symbol.get(symbol.upper(), ())
+    
+    if not found_stocks:
+        return _STOCK_MISSING_TMPL(symbol)
+    
+    # Single match
+    if len(found_stocks) == 1:
+        stock = found_stocks[0]
+        return f"""🔑 Instrument Key Found:
 
 Symbol: {stock['symbol']}
 Name: {stock['name']}
 Instrument Key: {stock['instrument_key']}
 Category: {stock['category']}"""
-        
-        # Multiple matches
-        result = f"🔑 Found {len(found_stocks)} matches for '{symbol}':\n\n"
-        for idx, stock in enumerate(found_stocks, 1):
-            result += f"""{idx}. Symbol: {stock['symbol']}
-   Name: {stock['name']}
-   Instrument Key: {stock['instrument_key']}
-   Category: {stock['category']}
-
-"""
-        return result
-            
-    except Exception as e:
-        return handle_api_error(e, "searching for instrument")
+    
+    # Multiple matches
+    parts = [f"🔑 Found {len(found_stocks)} matches for '{symbol}':\n\n"]
+    parts += [
+        _INSTRUMENT_MATCH_ROW(idx=idx, **stock)
+        for idx, stock in enumerate(found_stocks, 1)
+    ]
+    return "".join(parts)
 
 
 @mcp.tool()
+@mcp_tool("searching stocks")
 def search_stocks(search_term: str, limit: int = 10) -> str:
     """Search for stocks by symbol or name
     
@@ -340,52 +925,38 @@ def search_stocks(search_term: str, limit: int = 10) -> str:
     Returns:
         List of matching stocks with their details
     """
-    try:
-        categorized_stocks = load_stock_data()
-        
-        if not categorized_stocks:
-            return "❌ Error: Stock data not available"
-        
-        search_lower = search_term.lower()
-        matches = []
-        
-        # Search through all categories
-        for category, stocks in categorized_stocks.items():
-            for stock in stocks:
-                symbol_match = search_lower in stock['symbol'].lower()
-                name_match = search_lower in stock.get('name', '').lower()
-                
-                if symbol_match or name_match:
-                    matches.append({
-                        'symbol': stock['symbol'],
-                        'name': stock.get('name', 'N/A'),
-                        'instrument_key': stock['instrument_key'],
-                        'category': category
-                    })
-                    
-                    if len(matches) >= limit:
-                        break
-            
-            if len(matches) >= limit:
-                break
-        
-        if not matches:
-            return f"❌ No stocks found matching '{search_term}'"
-        
-        result = f"🔍 Search Results for '{search_term}' ({len(matches)} matches):\n\n"
-        
-        for idx, stock in enumerate(matches, 1):
-            result += f"""{idx}. {stock['symbol']} - {stock['name']}
-   Instrument Key: {stock['instrument_key']}
-   Category: {stock['category']}
+    categorized_stocks = load_stock_data()
+    
+    if not categorized_stocks:
+        return _STOCK_DATA_MISSING
+    
+    matches = find_stocks(search_term, limit)
+    
+    if not matches:
+        return _NO_SEARCH_MATCHES_TMPL(search_term)
+    
+    parts = [f"🔍 Search Results for '{search_term}' ({len(matches)} matches):\n\n"]
+    parts += [
+        _SEARCH_RESULT_ROW(idx=idx, **stock)
+        for idx, stock in enumerate(matches, 1)
+    ]
+    
+    return "".join(parts)
 
-"""
-        
-        return result
-        
-    except Exception as e:
-        return handle_api_error(e, "searching stocks")
+# ============================================================================
+# Server Tools
+# ============================================================================
+
+@mcp.tool()
+def get_server_metrics() -> str:
+    """Get cache, prefetch and API counters plus per-tool latency for this server
+    
+    Returns:
+        Metrics snapshot since the server started
+    """
+    return metrics.format_report()
 
 
 if __name__ == "__main__":
+    start_prefetcher()
     mcp.run(transport="stdio")